@@ -3,18 +3,46 @@
 
 import asyncio
 import datetime
-import os
 import json
-from typing import List, Optional, Dict, Any
+import os
+import random
+from dataclasses import asdict, dataclass
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
 
+import keyring
 from dotenv import load_dotenv
+from keyring.errors import KeyringError, NoKeyringError
 from pydantic import BaseModel
 
 from src.database.task_db import TaskDatabase, TaskRecord
 
+try:
+    from pyicloud import PyiCloudService
+    from pyicloud.exceptions import PyiCloudAPIResponseException
+    PYICLOUD_AVAILABLE = True
+except ImportError:
+    PYICLOUD_AVAILABLE = False
+
 # Load environment variables
 load_dotenv()
 
+# Service name used for storing iCloud credentials in the OS keyring
+KEYRING_SERVICE = "ios_reminders_agent"
+
+# Shown when no OS keyring backend is installed (common on headless Linux/WSL)
+NO_KEYRING_HINT = (
+    "No OS keyring backend is available, so credentials can't be saved. "
+    "Install one (e.g. libsecret/gnome-keyring, or `pip install keyrings.alt`) "
+    "or set ICLOUD_USERNAME and ICLOUD_PASSWORD instead."
+)
+
+# Plaintext credentials file written by earlier versions; migrated to the keyring
+LEGACY_CREDENTIALS_FILE = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)),
+    "credentials",
+    "icloud_credentials.json"
+)
+
 
 class Task(BaseModel):
     """Task model for extracted iOS Reminders tasks."""
@@ -26,6 +54,16 @@ class Task(BaseModel):
     list_name: Optional[str] = None  # The iOS Reminders list name
 
 
+@dataclass(slots=True, frozen=True)
+class TaskLite:
+    """Lightweight task used on the dedupe path instead of the Task model."""
+
+    name: str
+    priority: int
+    due_date: Optional[str] = None
+    list_name: Optional[str] = None
+
+
 class ImportantTasks(BaseModel):
     """Container for extracted tasks and summary."""
 
@@ -33,95 +71,217 @@ class ImportantTasks(BaseModel):
     summary: str
 
 
+def _is_throttled(error: Exception) -> bool:
+    """Check whether an iCloud API error is a rate-limit or throttle response."""
+    code = getattr(error, "code", None)
+    reason = getattr(error, "reason", "")
+    return code == 429 or "ACCESS_DENIED" in f"{code} {reason}"
+
+
+async def _retry(
+    coro_factory: Callable[[], Awaitable[Any]],
+    max_attempts: int = 3,
+    base: float = 6.0,
+    cap: float = 30.0,
+) -> Any:
+    """
+    Run an iCloud call, retrying throttled responses with exponential backoff.
+    
+    Args:
+        coro_factory: Callable returning a fresh awaitable for each attempt
+        max_attempts: Maximum number of attempts before giving up
+        base: Initial backoff delay in seconds
+        cap: Maximum backoff delay in seconds
+        
+    Returns:
+        Result of the awaited call
+    """
+    for attempt in range(max_attempts):
+        try:
+            return await coro_factory()
+        except PyiCloudAPIResponseException as e:
+            if not _is_throttled(e) or attempt == max_attempts - 1:
+                raise
+            delay = min(cap, base * 2 ** attempt) + random.random() * 0.1
+            print(f"iCloud throttled the request, retrying in {delay:.1f}s...")
+            await asyncio.sleep(delay)
+
+
 class IosRemindersExtractor:
     """Handles extraction of tasks from iOS Reminders."""
     
-    def __init__(self, credentials_file: Optional[str] = None):
-        """
-        Initialize the iOS Reminders extractor.
-        
-        Args:
-            credentials_file: Optional path to a file containing iCloud credentials
-        """
-        self.credentials_file = credentials_file or os.path.join(
-            os.path.dirname(os.path.abspath(__file__)), 
-            "credentials", 
-            "icloud_credentials.json"
-        )
+    def __init__(self):
+        """Initialize the iOS Reminders extractor."""
+        self._creds_cache: Optional[Dict[str, str]] = None
+        self._creds_loaded = False
+        self._keyring_available = True
     
-    def _get_credentials(self) -> Dict[str, str]:
+    def _read_keyring_credentials(self) -> Optional[Dict[str, str]]:
+        """Read saved credentials from the OS keyring, if present."""
+        try:
+            username = keyring.get_password(KEYRING_SERVICE, "icloud_username")
+            if username:
+                password = keyring.get_password(KEYRING_SERVICE, username)
+                if password:
+                    return {"username": username, "password": password}
+        except NoKeyringError:
+            self._keyring_available = False
+        except KeyringError as e:
+            print(f"Error reading credentials from keyring: {e}")
+
+        return None
+
+    def _save_keyring_credentials(self, username: str, password: str) -> bool:
+        """Store credentials in the OS keyring."""
+        try:
+            keyring.set_password(KEYRING_SERVICE, "icloud_username", username)
+            keyring.set_password(KEYRING_SERVICE, username, password)
+            return True
+        except NoKeyringError:
+            self._keyring_available = False
+            print(NO_KEYRING_HINT)
+            return False
+        except KeyringError as e:
+            print(f"Error saving credentials to keyring: {e}")
+            return False
+
+    def _migrate_credentials_file(self) -> Optional[Dict[str, str]]:
+        """Move credentials from the legacy plaintext file into the OS keyring."""
+        if not os.path.exists(LEGACY_CREDENTIALS_FILE):
+            return None
+
+        try:
+            with open(LEGACY_CREDENTIALS_FILE, 'r') as f:
+                creds = json.load(f)
+        except Exception as e:
+            print(f"Error reading credentials file: {e}")
+            return None
+
+        if 'username' not in creds or 'password' not in creds:
+            return None
+
+        # Only remove the plaintext file once the keyring holds the credentials
+        if self._save_keyring_credentials(creds['username'], creds['password']):
+            os.remove(LEGACY_CREDENTIALS_FILE)
+            print("Moved saved iCloud credentials from credentials file to the OS keyring.")
+
+        return {"username": creds['username'], "password": creds['password']}
+
+    async def load_saved_credentials(self) -> Optional[Dict[str, str]]:
         """
-        Get iCloud credentials from file or environment variables.
+        Load iCloud credentials from environment variables or the OS keyring.
+        
+        Never prompts the user.
         
         Returns:
-            Dictionary containing 'username' and 'password'
+            Dictionary containing 'username' and 'password', or None if not found
         """
+        if self._creds_loaded:
+            return self._creds_cache
+        self._creds_loaded = True
+
         # Try environment variables first
         username = os.getenv("ICLOUD_USERNAME")
         password = os.getenv("ICLOUD_PASSWORD")
         
         if username and password:
-            return {"username": username, "password": password}
+            self._creds_cache = {"username": username, "password": password}
+            return self._creds_cache
         
-        # Try credentials file if it exists
-        if os.path.exists(self.credentials_file):
-            try:
-                with open(self.credentials_file, 'r') as f:
-                    creds = json.load(f)
-                    if 'username' in creds and 'password' in creds:
-                        return creds
-            except Exception as e:
-                print(f"Error reading credentials file: {e}")
+        # Migrate credentials saved by earlier versions, then try the OS keyring
+        creds = await asyncio.to_thread(self._migrate_credentials_file)
+        if not creds:
+            creds = await asyncio.to_thread(self._read_keyring_credentials)
+        if creds:
+            self._creds_cache = creds
+        return self._creds_cache
+
+    async def get_credentials(self) -> Dict[str, str]:
+        """
+        Get iCloud credentials, prompting the user if none are saved.
+        
+        Returns:
+            Dictionary containing 'username' and 'password'
+        """
+        creds = await self.load_saved_credentials()
+        if creds:
+            return creds
         
         # If nothing found, prompt the user
-        print("\niCloud credentials not found in environment or credentials file.")
-        username = input("Enter your iCloud email: ")
-        password = input("Enter your iCloud password: ")
+        print("\niCloud credentials not found in environment or keyring.")
+        username = await asyncio.to_thread(input, "Enter your iCloud email: ")
+        password = await asyncio.to_thread(input, "Enter your iCloud password: ")
         
         # Save for future use if desired
-        save = input("Save these credentials for future use? (y/n): ").lower() == 'y'
-        if save:
-            os.makedirs(os.path.dirname(self.credentials_file), exist_ok=True)
-            with open(self.credentials_file, 'w') as f:
-                json.dump({"username": username, "password": password}, f)
+        if not self._keyring_available:
+            print(NO_KEYRING_HINT)
+        else:
+            save = await asyncio.to_thread(input, "Save these credentials for future use? (y/n): ")
+            if save.lower() == 'y':
+                await asyncio.to_thread(self._save_keyring_credentials, username, password)
         
-        return {"username": username, "password": password}
+        self._creds_cache = {"username": username, "password": password}
+        return self._creds_cache
     
-    async def extract_tasks(self) -> ImportantTasks:
+    async def extract_lite_tasks(
+        self, credentials: Optional[Dict[str, str]] = None
+    ) -> Tuple[List[TaskLite], str]:
+        """
+        Extract tasks from iOS Reminders without building Pydantic models.
+        
+        Args:
+            credentials: Optional pre-loaded iCloud credentials
+            
+        Returns:
+            Tuple of the extracted TaskLite objects and a summary string
+        """
+        # Get credentials
+        if credentials is None:
+            credentials = await self.get_credentials()
+        
+        # Extract tasks using pyicloud
+        tasks = await self._extract_tasks_from_icloud(
+            credentials["username"], 
+            credentials["password"]
+        )
+        
+        # Create summary
+        now_iso = datetime.datetime.now().isoformat()
+        due_soon = sum(1 for task in tasks if task.due_date and task.due_date <= now_iso)
+        high_priority = sum(1 for task in tasks if task.priority == 1)
+        
+        summary = (
+            f"Found {len(tasks)} tasks in iOS Reminders. "
+            f"{due_soon} tasks are due soon. "
+            f"{high_priority} tasks are high priority."
+        )
+        
+        return tasks, summary
+
+    async def extract_tasks(
+        self, credentials: Optional[Dict[str, str]] = None
+    ) -> ImportantTasks:
         """
         Extract tasks from iOS Reminders.
         
+        Args:
+            credentials: Optional pre-loaded iCloud credentials
+            
         Returns:
             ImportantTasks object containing extracted tasks and summary
         """
         try:
-            # Get credentials
-            credentials = self._get_credentials()
-            
-            # Extract tasks using pyicloud (will be implemented)
-            tasks = await self._extract_tasks_from_icloud(
-                credentials["username"], 
-                credentials["password"]
+            tasks, summary = await self.extract_lite_tasks(credentials)
+            return ImportantTasks(
+                tasks=[Task(**asdict(task)) for task in tasks], summary=summary
             )
-            
-            # Create summary
-            due_soon = sum(1 for task in tasks if task.due_date and task.due_date <= datetime.datetime.now().isoformat())
-            high_priority = sum(1 for task in tasks if task.priority == 1)
-            
-            summary = (
-                f"Found {len(tasks)} tasks in iOS Reminders. "
-                f"{due_soon} tasks are due soon. "
-                f"{high_priority} tasks are high priority."
-            )
-            
-            return ImportantTasks(tasks=tasks, summary=summary)
         
         except Exception as e:
             print(f"Error extracting tasks: {e}")
             # Return empty result on error
             return ImportantTasks(tasks=[], summary=f"Error: {str(e)}")
     
-    async def _extract_tasks_from_icloud(self, username: str, password: str) -> List[Task]:
+    async def _extract_tasks_from_icloud(self, username: str, password: str) -> List[TaskLite]:
         """
         Extract tasks from iCloud Reminders.
         
@@ -130,41 +290,106 @@ class IosRemindersExtractor:
             password: iCloud password
             
         Returns:
-            List of Task objects
+            List of TaskLite objects
         """
+        if not PYICLOUD_AVAILABLE:
+            print("Note: pyicloud is not installed. Returning placeholder tasks.")
+            return self._placeholder_tasks()
+
         try:
-            # This is a placeholder for the actual implementation
-            # In a real implementation, we would use pyicloud:
-            # from pyicloud import PyiCloudService
-            # api = PyiCloudService(username, password)
-            # Handle 2FA if needed
-            # Extract reminders from api.reminders
-            
-            # For now, we'll return placeholder tasks for demonstration
-            print("Note: This is a placeholder implementation. Real iCloud integration will need to be implemented.")
-            
-            # Placeholder tasks
-            tasks = [
-                Task(
-                    name="Sample iOS Reminder 1",
-                    priority=1,
-                    due_date=datetime.datetime.now().isoformat(),
-                    list_name="Work"
-                ),
-                Task(
-                    name="Sample iOS Reminder 2",
-                    priority=2,
-                    due_date=(datetime.datetime.now() + datetime.timedelta(days=1)).isoformat(),
-                    list_name="Personal"
-                )
-            ]
-            
+            # pyicloud is blocking, so keep its network calls off the event loop
+            api = await _retry(
+                lambda: asyncio.to_thread(PyiCloudService, username, password)
+            )
+
+            if not await self._verify_session(api):
+                return []
+
+            # Accessing api.reminders fetches every list in a single request
+            reminders = await _retry(lambda: asyncio.to_thread(lambda: api.reminders))
+
+            tasks = []
+            for list_name, items in reminders.lists.items():
+                for item in items:
+                    due = item.get("due")
+                    tasks.append(
+                        TaskLite(
+                            name=item["title"],
+                            priority=2,  # pyicloud does not expose reminder priority
+                            due_date=due.isoformat() if due else None,
+                            list_name=list_name,
+                        )
+                    )
+
             return tasks
             
         except Exception as e:
             print(f"Error connecting to iCloud: {e}")
             return []
 
+    async def _verify_session(self, api: Any) -> bool:
+        """
+        Complete two-factor or two-step verification for a new iCloud session.
+        
+        Args:
+            api: Logged-in PyiCloudService instance
+            
+        Returns:
+            True if the session is ready to use
+        """
+        if api.requires_2fa:
+            code = await asyncio.to_thread(input, "Enter the 2FA code sent to your device: ")
+            if not await asyncio.to_thread(api.validate_2fa_code, code):
+                print("Failed to verify 2FA code.")
+                return False
+
+            # Trust the session so 2FA isn't requested again on the next run
+            if not api.is_trusted_session:
+                if not await asyncio.to_thread(api.trust_session):
+                    print("Failed to trust session. 2FA will be required next run.")
+
+        elif api.requires_2sa:
+            devices = await asyncio.to_thread(lambda: api.trusted_devices)
+            print("\nTrusted devices:")
+            for i, device in enumerate(devices):
+                name = device.get("deviceName", f"SMS to {device.get('phoneNumber')}")
+                print(f"  {i}: {name}")
+
+            choice = await asyncio.to_thread(input, "Which device should receive the code? ")
+            try:
+                device = devices[int(choice)]
+            except (ValueError, IndexError):
+                print("Invalid device selection.")
+                return False
+
+            if not await asyncio.to_thread(api.send_verification_code, device):
+                print("Failed to send verification code.")
+                return False
+
+            code = await asyncio.to_thread(input, "Enter the verification code: ")
+            if not await asyncio.to_thread(api.validate_verification_code, device, code):
+                print("Failed to verify verification code.")
+                return False
+
+        return True
+
+    def _placeholder_tasks(self) -> List[TaskLite]:
+        """Sample tasks used when pyicloud is not available."""
+        return [
+            TaskLite(
+                name="Sample iOS Reminder 1",
+                priority=1,
+                due_date=datetime.datetime.now().isoformat(),
+                list_name="Work"
+            ),
+            TaskLite(
+                name="Sample iOS Reminder 2",
+                priority=2,
+                due_date=(datetime.datetime.now() + datetime.timedelta(days=1)).isoformat(),
+                list_name="Personal"
+            )
+        ]
+
 
 async def extract_ios_reminders_tasks() -> ImportantTasks:
     """
@@ -177,35 +402,59 @@ async def extract_ios_reminders_tasks() -> ImportantTasks:
     return await extractor.extract_tasks()
 
 
+async def _open_db() -> TaskDatabase:
+    """Open the task database without blocking the event loop."""
+    return await asyncio.to_thread(TaskDatabase)
+
+
 async def main():
     """Main entry point for the iOS Reminders task extraction agent."""
     print("=" * 50)
     print("iOS REMINDERS TASK EXTRACTION AGENT")
     print("=" * 50)
 
-    # Initialize database
-    db = TaskDatabase()
+    # Open the database while saved credentials load; only prompt for missing
+    # credentials once the database is open, so a failed open can't leave a
+    # pending input() thread behind
+    extractor = IosRemindersExtractor()
+    db, _ = await asyncio.gather(_open_db(), extractor.load_saved_credentials())
 
     try:
+        credentials = await extractor.get_credentials()
+
         print("\n📱 Connecting to iOS Reminders...")
         print("🔄 Processing...")
 
-        # Extract tasks
-        result = await extract_ios_reminders_tasks()
+        # Extract tasks as lightweight dataclasses for the dedupe loop
+        try:
+            tasks, summary = await extractor.extract_lite_tasks(credentials)
+        except Exception as e:
+            print(f"Error extracting tasks: {e}")
+            tasks, summary = [], f"Error: {str(e)}"
 
-        if result and result.tasks:
-            print(f"\n✅ Found {len(result.tasks)} tasks")
+        if tasks:
+            print(f"\n✅ Found {len(tasks)} tasks")
             print("\n📊 SUMMARY:")
-            print(f"   {result.summary}")
+            print(f"   {summary}")
 
             print("\n📋 EXTRACTED TASKS:")
             priority_map = {1: "🔴 HIGH", 2: "🟡 MEDIUM", 3: "🟢 LOW"}
 
             # Process and store tasks
             new_tasks = []
+            new_task_records = []
             duplicate_tasks = []
 
-            for i, task in enumerate(result.tasks, 1):
+            # Exact name matches are caught by a set lookup; only the rest go
+            # through the batched fuzzy lookup
+            existing = db.all_names_lower()
+            dup_map = db.find_similar_tasks_batch(
+                [t.name for t in tasks if t.name.lower() not in existing]
+            )
+
+            now_iso = datetime.datetime.now().isoformat()
+
+            for i, task in enumerate(tasks, 1):
                 print(f"\n{i}. {task.name}")
                 print(f"   Priority: {priority_map.get(task.priority, '❓ UNKNOWN')}")
                 if task.due_date:
@@ -213,28 +462,26 @@ async def main():
                 if task.list_name:
                     print(f"   List: {task.list_name}")
 
-                # Check for duplicates
-                is_duplicate = False
-                similar_tasks = db.find_similar_tasks(task.name)
-                if (
-                    similar_tasks
-                    and len(similar_tasks) > 0
-                    and similar_tasks[0].similarity_distance < 0.1
-                ):
-                    is_duplicate = True
+                # Check for duplicates; names queued earlier in this run are added
+                # to the exact-match set so repeats within one extraction are caught
+                if task.name.lower() in existing or dup_map[task.name]:
                     duplicate_tasks.append(task)
                     continue
+                existing.add(task.name.lower())
 
-                # Add new task to database
+                # Queue new task for the database
                 db_task = TaskRecord(
                     name=task.name,
                     priority=task.priority,
-                    due_date=task.due_date or datetime.datetime.now().isoformat(),
-                    created_at=datetime.datetime.now().isoformat(),
+                    due_date=task.due_date or now_iso,
+                    created_at=now_iso,
                 )
-                db.add_task(db_task)
+                new_task_records.append(db_task)
                 new_tasks.append(task)
 
+            # Save all new tasks in a single transaction
+            db.add_tasks_bulk(new_task_records)
+
             # Print summary of database operations
             if new_tasks:
                 print(f"\n💾 Saved {len(new_tasks)} new tasks to database")
@@ -246,26 +493,38 @@ async def main():
                     print(f"   - {task.name}")
 
             # Prompt to print tasks
-            print_tasks = input("\nDo you want to print these tasks to receipt printer? (y/n): ")
+            print_tasks = await asyncio.to_thread(
+                input, "\nDo you want to print these tasks to receipt printer? (y/n): "
+            )
             if print_tasks.lower() == 'y':
                 print("\n🖨️ Sending tasks to printer...")
                 # Import here to avoid circular imports
                 from src.task_card_generator import create_task_image, print_to_thermal_printer
                 
-                for task in new_tasks:
-                    task_data = {
-                        "title": task.name,
-                        "priority": priority_map.get(task.priority, "UNKNOWN"),
-                        "due_date": task.due_date or "Today",
-                        "list": task.list_name or "Default"
-                    }
-                    
-                    # Create and print task image
-                    image_path = create_task_image(task_data)
+                # Start rendering every image up front, then print in list
+                # order so later renders overlap with earlier print jobs
+                renders = [
+                    asyncio.create_task(
+                        asyncio.to_thread(
+                            create_task_image,
+                            {
+                                "title": task.name,
+                                "priority": priority_map.get(task.priority, "UNKNOWN"),
+                                "due_date": task.due_date or "Today",
+                                "list": task.list_name or "Default"
+                            },
+                        )
+                    )
+                    for task in new_tasks
+                ]
+
+                for task, render in zip(new_tasks, renders):
+                    # Wait for this task's image, then print it
+                    image_path = await render
                     if image_path:
                         try:
                             print(f"   Printing: {task.name}")
-                            print_to_thermal_printer(image_path)
+                            await asyncio.to_thread(print_to_thermal_printer, image_path)
                         except Exception as e:
                             print(f"   ⚠️ Printing failed: {e}")
                 
@@ -277,9 +536,10 @@ async def main():
     except Exception as e:
         print(f"\n❌ Error: {str(e)}")
 
-    print("\n" + "=" * 50)
-    # Close database connection
-    db.close()
+    finally:
+        print("\n" + "=" * 50)
+        # Close database connection
+        db.close()
 
 
 if __name__ == "__main__":
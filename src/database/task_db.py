@@ -1,9 +1,10 @@
 """Task database with embeddings using Turso and libsql."""
 
 import os
-from dataclasses import dataclass
+from collections import defaultdict
+from dataclasses import dataclass, replace
 from datetime import datetime
-from typing import Any, List, Optional
+from typing import Any, Dict, List, Optional, Set
 
 try:
     import libsql_experimental as libsql
@@ -13,8 +14,11 @@ except ImportError:
     print("⚠️  Warning: libsql-experimental not installed. Database features disabled.")
     print("   Install it separately or run in WSL for full functionality.")
 
+import numpy as np
 from dotenv import load_dotenv
 from openai import OpenAI
+from rapidfuzz import process
+from rapidfuzz.distance import Levenshtein
 
 load_dotenv()
 
@@ -35,6 +39,15 @@ class TaskRecord:
     )
 
 
+# Below this many name pairs, thread pool startup costs more than it saves
+_PARALLEL_MIN_PAIRS = 10_000
+
+
+def _bucket_key(name: str) -> str:
+    """Cheap lexical key used to group names before edit-distance checks."""
+    return name.lower()[:3]
+
+
 class TaskDatabase:
     """Manage tasks with embeddings in Turso database."""
 
@@ -55,6 +68,7 @@ class TaskDatabase:
         self.openai = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
         self.embedding_model = "text-embedding-3-small"
         self.embedding_dimensions = 1536  # Default for text-embedding-3-small
+        self.embedding_batch_size = 2048  # Max inputs per embeddings request
 
         # Connect to database
         if self.db_url and self.auth_token:
@@ -93,19 +107,38 @@ class TaskDatabase:
         response = self.openai.embeddings.create(model=self.embedding_model, input=text)
         return response.data[0].embedding
 
-    def add_task(self, task: Any, email_context: Optional[str] = None) -> TaskRecord:
-        """Add a task to the database with embeddings."""
-        # Generate embedding from task name and context
-        embedding_text = f"{task.name}"
+    def generate_embeddings(self, texts: List[str]) -> List[List[float]]:
+        """Generate embeddings for several texts, batching OpenAI requests."""
+        embeddings = []
+        for start in range(0, len(texts), self.embedding_batch_size):
+            response = self.openai.embeddings.create(
+                model=self.embedding_model,
+                input=texts[start : start + self.embedding_batch_size],
+            )
+            embeddings.extend(
+                item.embedding for item in sorted(response.data, key=lambda d: d.index)
+            )
+        return embeddings
+
+    def _embedding_text(self, name: str, email_context: Optional[str]) -> str:
+        """Build the text embedded for a task from its name and context."""
+        embedding_text = f"{name}"
         if email_context:
             embedding_text += f" Context: {email_context}"
+        return embedding_text
 
-        embedding = self.generate_embedding(embedding_text)
-
+    def _insert_task(
+        self,
+        cursor: Any,
+        task: Any,
+        embedding: List[float],
+        created_at: str,
+        email_context: Optional[str],
+    ) -> TaskRecord:
+        """Insert a task row without committing and return its record."""
         # Convert embedding to vector format
         embedding_str = "[" + ",".join(map(str, embedding)) + "]"
 
-        cursor = self.conn.cursor()
         cursor.execute(
             """
             INSERT INTO tasks (name, priority, due_date, created_at, email_context, embedding)
@@ -115,26 +148,66 @@ class TaskDatabase:
                 task.name,
                 task.priority,
                 task.due_date,
-                datetime.now().isoformat(),
+                created_at,
                 email_context,
                 embedding_str,
             ),
         )
 
-        task_id = cursor.lastrowid
-        self.conn.commit()
-        cursor.close()
-
         return TaskRecord(
-            id=task_id,
+            id=cursor.lastrowid,
             name=task.name,
             priority=task.priority,
             due_date=task.due_date,
-            created_at=datetime.now().isoformat(),
+            created_at=created_at,
             embedding=embedding,
             email_context=email_context,
         )
 
+    def add_task(self, task: Any, email_context: Optional[str] = None) -> TaskRecord:
+        """Add a task to the database with embeddings."""
+        # Generate embedding from task name and context
+        embedding = self.generate_embedding(self._embedding_text(task.name, email_context))
+
+        cursor = self.conn.cursor()
+        record = self._insert_task(
+            cursor, task, embedding, datetime.now().isoformat(), email_context
+        )
+        self.conn.commit()
+        cursor.close()
+
+        return record
+
+    def add_tasks_bulk(self, tasks: List[Any]) -> List[TaskRecord]:
+        """Add several tasks to the database in a single transaction."""
+        if not tasks:
+            return []
+
+        contexts = [getattr(task, "email_context", None) for task in tasks]
+        embeddings = self.generate_embeddings(
+            [
+                self._embedding_text(task.name, context)
+                for task, context in zip(tasks, contexts)
+            ]
+        )
+        default_created_at = datetime.now().isoformat()
+
+        cursor = self.conn.cursor()
+        records = [
+            self._insert_task(
+                cursor,
+                task,
+                embedding,
+                getattr(task, "created_at", None) or default_created_at,
+                context,
+            )
+            for task, embedding, context in zip(tasks, embeddings, contexts)
+        ]
+        self.conn.commit()
+        cursor.close()
+
+        return records
+
     def find_similar_tasks(self, query: str, limit: int = 5) -> List[TaskRecord]:
         """Find similar tasks based on embedding similarity."""
         # Generate embedding for query
@@ -172,6 +245,78 @@ class TaskDatabase:
         cursor.close()
         return results
 
+    def all_names_lower(self) -> Set[str]:
+        """Get the lowercased names of all stored tasks."""
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT name FROM tasks")
+        names = {row[0].lower() for row in cursor.fetchall()}
+        cursor.close()
+        return names
+
+    def find_similar_tasks_batch(
+        self, names: List[str], threshold: float = 0.1, limit: int = 5
+    ) -> Dict[str, List[TaskRecord]]:
+        """Find near-duplicate tasks by normalized edit distance for many names.
+
+        All stored tasks are loaded in a single query and bucketed by the first
+        three lowercase characters of their name; each incoming name is only
+        compared against rows in its own bucket. Each bucket is scored as a
+        single rapidfuzz distance matrix, spread across all CPU cores only when
+        the bucket is large enough to benefit. A row is a match when its
+        normalized distance is strictly below ``threshold``.
+        """
+        cursor = self.conn.cursor()
+        cursor.execute(
+            """
+            SELECT id, name, priority, due_date, created_at, email_context
+            FROM tasks
+        """
+        )
+
+        buckets: Dict[str, List[TaskRecord]] = defaultdict(list)
+        for row in cursor.fetchall():
+            record = TaskRecord(
+                id=row[0],
+                name=row[1],
+                priority=row[2],
+                due_date=row[3],
+                created_at=row[4],
+                email_context=row[5],
+            )
+            buckets[_bucket_key(record.name)].append(record)
+
+        cursor.close()
+
+        # Group incoming names by bucket so each bucket is scored in one call
+        queries_by_bucket: Dict[str, List[str]] = defaultdict(list)
+        for name in names:
+            queries_by_bucket[_bucket_key(name)].append(name)
+
+        results: Dict[str, List[TaskRecord]] = {name: [] for name in names}
+        for key, queries in queries_by_bucket.items():
+            bucket = buckets.get(key)
+            if not bucket:
+                continue
+
+            distances = process.cdist(
+                queries,
+                [record.name for record in bucket],
+                scorer=Levenshtein.normalized_distance,
+                processor=str.lower,
+                score_cutoff=threshold,
+                dtype=np.float64,
+                workers=-1 if len(queries) * len(bucket) >= _PARALLEL_MIN_PAIRS else 1,
+            )
+            for query, row in zip(queries, distances):
+                matches = np.flatnonzero(row < threshold)
+                matches = matches[np.argsort(row[matches], kind="stable")][:limit]
+                results[query] = [
+                    replace(bucket[index], similarity_distance=float(row[index]))
+                    for index in matches
+                ]
+
+        return results
+
     def get_recent_tasks(self, limit: int = 10) -> List[TaskRecord]:
         """Get most recent tasks."""
         cursor = self.conn.cursor()